@@ -0,0 +1,74 @@
+import os
+import time
+import threading
+
+# --- User Allowlist Configuration ---
+USER_IDS_FILE = "user_ids.txt"
+ALLOWLIST_CHECK_INTERVAL = 1.0 # Minimum seconds between stat() calls on the allowlist file
+ALLOWLIST_EMPTY_GRACE = 5.0    # Seconds a missing or empty file is tolerated (a non-atomic save) before revoking everyone
+
+
+class UserAllowlist:
+    """
+    Set of allowed user emails loaded from a text file (one per line).
+    The file is only re-read when its mtime or size changes, so lookups are O(1) set membership.
+    If the file goes missing or empty, the previous users stay allowed for empty_grace seconds
+    so a save in progress does not stop every session; after that nobody is allowed.
+    """
+
+    def __init__(self, path=USER_IDS_FILE, check_interval=ALLOWLIST_CHECK_INTERVAL, empty_grace=ALLOWLIST_EMPTY_GRACE):
+        self.path = path
+        self.check_interval = check_interval
+        self.empty_grace = empty_grace
+        self._lock = threading.Lock()
+        self._users = frozenset()
+        self._signature = None
+        self._last_check = None
+        self._empty_since = None # When a missing/empty file was first seen while users were still allowed
+
+    def refresh(self, force=False):
+        """Reloads the file if it changed since the last load."""
+        now = time.monotonic()
+        if not force and self._last_check is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                st = os.stat(self.path)
+                signature = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                signature = "missing"
+            if signature != self._signature:
+                users = frozenset()
+                if signature != "missing":
+                    try:
+                        with open(self.path, "r") as file:
+                            users = frozenset(line.strip() for line in file if line.strip())
+                    except Exception as e:
+                        print(f"Error reading {self.path}: {e}") # Keep serving the previous list
+                        return
+                self._signature = signature
+                if users or not self._users:
+                    self._users, self._empty_since = users, None
+                    return
+                self._empty_since = now
+                print(f"Warning: {self.path} is missing or empty. Keeping the previous {len(self._users)} allowed users for {self.empty_grace:.0f}s.")
+            if self._empty_since is not None and now - self._empty_since >= self.empty_grace:
+                print(f"{self.path} is still missing or empty. Revoking all {len(self._users)} users.")
+                self._users, self._empty_since = frozenset(), None
+
+    def __contains__(self, email):
+        self.refresh()
+        return email in self._users
+
+    def __len__(self):
+        self.refresh()
+        return len(self._users)
+
+
+user_allowlist = UserAllowlist()
+
+
+def is_user_active(email):
+    """Checks if a user's email exists in the user_ids.txt file."""
+    return email in user_allowlist
@@ -4,247 +4,23 @@ import websocket
 import json
 import os
 import decimal
-import sqlite3
 import pandas as pd
 from datetime import datetime
 
+from storage import (
+    storage, create_table_if_not_exists, get_bot_running_status, update_bot_running_status,
+    start_new_session_in_db, update_is_running_status, clear_session_data, get_session_status_from_db,
+    bot_worker_id, claim_active_sessions, renew_session_claim, update_stats_and_trade_info_in_db,
+)
+from stats_api import stats_cache, start_stats_api
+from allowlist import is_user_active
+from profiler import profiled, profile_iteration, start_profiler
+
 # --- IMPORTANT: Use multiprocessing for true background execution ---
 import multiprocessing
 
-# --- SQLite Database Configuration ---
-DB_FILE = "trading_data0099.db"
-
-# --- Database & Utility Functions ---
-def create_connection():
-    """Create a database connection to the SQLite database specified by DB_FILE"""
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        return conn
-    except sqlite3.Error as e:
-        return None
-
-def create_table_if_not_exists():
-    """Create the sessions and bot_status tables if they do not exist."""
-    conn = create_connection()
-    if conn:
-        try:
-            # Table for session data
-            sql_create_sessions_table = """
-            CREATE TABLE IF NOT EXISTS sessions (
-                email TEXT PRIMARY KEY,
-                user_token TEXT NOT NULL,
-                base_amount REAL NOT NULL,
-                tp_target REAL NOT NULL,
-                max_consecutive_losses INTEGER NOT NULL,
-                total_wins INTEGER DEFAULT 0,
-                total_losses INTEGER DEFAULT 0,
-                current_amount REAL NOT NULL,
-                consecutive_losses INTEGER DEFAULT 0,
-                initial_balance REAL DEFAULT 0.0,
-                contract_id TEXT,
-                trade_start_time REAL DEFAULT 0.0,
-                is_running INTEGER DEFAULT 0 
-            );
-            """
-            # Table for global bot status and process management
-            sql_create_bot_status_table = """
-            CREATE TABLE IF NOT EXISTS bot_status (
-                flag_id INTEGER PRIMARY KEY,
-                is_running_flag INTEGER DEFAULT 0, -- 0: Stopped, 1: Running
-                last_heartbeat REAL DEFAULT 0.0,
-                process_pid INTEGER DEFAULT 0   -- Stores the PID of the bot process
-            );
-            """
-            conn.execute(sql_create_sessions_table)
-            conn.execute(sql_create_bot_status_table)
-            
-            # Check and insert the initial status row if it doesn't exist
-            cursor = conn.execute("SELECT COUNT(*) FROM bot_status WHERE flag_id = 1")
-            if cursor.fetchone()[0] == 0:
-                conn.execute("INSERT INTO bot_status (flag_id, is_running_flag, last_heartbeat, process_pid) VALUES (1, 0, 0.0, 0)")
-            
-            conn.commit()
-        except sqlite3.Error as e:
-            print(f"Database error during table creation: {e}") # For debugging
-        finally:
-            conn.close()
-
-def get_bot_running_status():
-    """
-    Gets the global bot running status from the database.
-    Also checks for process liveness and timeouts.
-    """
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                cursor = conn.execute("SELECT is_running_flag, last_heartbeat, process_pid FROM bot_status WHERE flag_id = 1")
-                row = cursor.fetchone()
-                if row:
-                    status, heartbeat, pid = row
-                    
-                    # Check if the process is supposed to be running but no heartbeat or old heartbeat
-                    if status == 1:
-                        # Check if the PID is valid and the process is alive
-                        if pid and os.path.exists(f"/proc/{pid}"): # Linux specific check for process existence
-                            if (time.time() - heartbeat > 30): # Heartbeat timeout (30 seconds)
-                                print(f"Bot process {pid} timed out. Marking as stopped.")
-                                update_bot_running_status(0, 0) # Mark as stopped if no heartbeat
-                                return 0
-                            else:
-                                return status # Bot is running and heartbeat is recent
-                        else:
-                            # Process is not alive (or PID invalid), mark as stopped
-                            print(f"Bot process {pid} not found. Marking as stopped.")
-                            update_bot_running_status(0, 0)
-                            return 0
-                    else:
-                        return 0 # Bot is explicitly stopped
-                return 0 # No status found, assume stopped
-        except sqlite3.Error as e:
-            print(f"Database error in get_bot_running_status: {e}")
-            return 0
-        finally:
-            conn.close()
-    return 0 # Connection failed
-
-def update_bot_running_status(status, pid):
-    """Updates the global bot running status and PID in the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                conn.execute("UPDATE bot_status SET is_running_flag = ?, last_heartbeat = ?, process_pid = ? WHERE flag_id = 1", (status, time.time(), pid))
-        except sqlite3.Error as e:
-            print(f"Database error in update_bot_running_status: {e}")
-        finally:
-            conn.close()
-
-def is_any_session_running():
-    """Checks if there is any active session in the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                cursor = conn.execute("SELECT COUNT(*) FROM sessions WHERE is_running = 1")
-                count = cursor.fetchone()[0]
-                return count > 0
-        except sqlite3.Error as e:
-            print(f"Database error in is_any_session_running: {e}")
-            return True # Assume running to be safe
-        finally:
-            conn.close()
-    return True # Connection failed, assume running to be safe
-
-def is_user_active(email):
-    """Checks if a user's email exists in the user_ids.txt file."""
-    try:
-        with open("user_ids.txt", "r") as file:
-            active_users = [line.strip() for line in file.readlines()]
-        return email in active_users
-    except FileNotFoundError:
-        return False
-    except Exception as e:
-        print(f"Error reading user_ids.txt: {e}")
-        return False
-
-def start_new_session_in_db(email, settings):
-    """Saves or updates user settings and initializes session data in the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                conn.execute("""
-                    INSERT OR REPLACE INTO sessions 
-                    (email, user_token, base_amount, tp_target, max_consecutive_losses, current_amount, is_running)
-                    VALUES (?, ?, ?, ?, ?, ?, 1)
-                    """, (email, settings["user_token"], settings["base_amount"], settings["tp_target"], settings["max_consecutive_losses"], settings["base_amount"]))
-        except sqlite3.Error as e:
-            print(f"Database error in start_new_session_in_db: {e}")
-        finally:
-            conn.close()
-
-def update_is_running_status(email, status):
-    """Updates the is_running status for a specific user session in the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                conn.execute("UPDATE sessions SET is_running = ? WHERE email = ?", (status, email))
-        except sqlite3.Error as e:
-            print(f"Database error in update_is_running_status: {e}")
-        finally:
-            conn.close()
-
-def clear_session_data(email):
-    """Deletes a user's session data from the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                conn.execute("DELETE FROM sessions WHERE email=?", (email,))
-        except sqlite3.Error as e:
-            print(f"Database error in clear_session_data: {e}")
-        finally:
-            conn.close()
-
-def get_session_status_from_db(email):
-    """Retrieves the current session status for a given email from the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.execute("SELECT * FROM sessions WHERE email=?", (email,))
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
-        except sqlite3.Error as e:
-            print(f"Database error in get_session_status_from_db: {e}")
-            return None
-        finally:
-            conn.close()
-    return None
-
-def get_all_active_sessions():
-    """Fetches all currently active trading sessions from the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.execute("SELECT * FROM sessions WHERE is_running = 1")
-                rows = cursor.fetchall()
-                sessions = []
-                for row in rows:
-                    sessions.append(dict(row))
-                return sessions
-        except sqlite3.Error as e:
-            print(f"Database error in get_all_active_sessions: {e}")
-            return []
-        finally:
-            conn.close()
-    return []
-
-def update_stats_and_trade_info_in_db(email, total_wins, total_losses, current_amount, consecutive_losses, initial_balance=None, contract_id=None, trade_start_time=None):
-    """Updates trading statistics and trade information for a user in the database."""
-    conn = create_connection()
-    if conn:
-        try:
-            with conn:
-                update_query = """
-                UPDATE sessions SET 
-                    total_wins = ?, total_losses = ?, current_amount = ?, consecutive_losses = ?, 
-                    initial_balance = COALESCE(?, initial_balance), contract_id = ?, trade_start_time = COALESCE(?, trade_start_time)
-                WHERE email = ?
-                """
-                conn.execute(update_query, (total_wins, total_losses, current_amount, consecutive_losses, initial_balance, contract_id, trade_start_time, email))
-        except sqlite3.Error as e:
-            print(f"Database error in update_stats_and_trade_info_in_db: {e}")
-        finally:
-            conn.close()
-
 # --- WebSocket Helper Functions ---
+@profiled("broker.connect_websocket")
 def connect_websocket(user_token):
     """Establishes a WebSocket connection and authenticates the user."""
     ws = websocket.WebSocket()
@@ -262,6 +38,7 @@ def connect_websocket(user_token):
         print(f"Error connecting to WebSocket: {e}")
         return None
 
+@profiled("broker.get_balance_and_currency")
 def get_balance_and_currency(user_token):
     """Fetches the user's current balance and currency using WebSocket."""
     ws = None
@@ -296,6 +73,10 @@ def check_contract_status(ws, contract_id):
         print(f"Error checking contract status: {e}")
         return None
 
+def get_stake_amount(current_amount):
+    """Returns the stake actually sent to Deriv for a session's current bet amount."""
+    return max(0.35, round(float(current_amount), 2))
+
 def place_order(ws, proposal_id, amount):
     """Places a trade order on Deriv."""
     if not ws or not ws.connected:
@@ -311,6 +92,7 @@ def place_order(ws, proposal_id, amount):
         return {"error": {"message": "Order placement failed."}}
 
 # --- Trading Bot Logic ---
+@profiled("analyse_data")
 def analyse_data(df_ticks):
     """
     Analyzes tick data to generate a trading signal based on a 60-tick and 5-tick trend.
@@ -336,6 +118,7 @@ def analyse_data(df_ticks):
             return "Sell", "Detected an uptrend reversal on 5 ticks against a 60-tick downtrend."
     
     return "Neutral", "No clear reversal signal from combined analysis."
+@profiled("run_trading_job_for_user")
 def run_trading_job_for_user(session_data, check_only=False):
     """Executes the trading logic for a specific user's session."""
     email = session_data['email']
@@ -362,6 +145,7 @@ def run_trading_job_for_user(session_data, check_only=False):
             contract_info = check_contract_status(ws, contract_id)
             if contract_info and contract_info.get('is_sold'): # Trade has finished
                 profit = float(contract_info.get('profit', 0))
+                stats_cache.record_trade(email, "closed", contract_id, amount=get_stake_amount(current_amount), profit=profit)
                 
                 if profit > 0:
                     consecutive_losses = 0
@@ -443,7 +227,7 @@ def run_trading_job_for_user(session_data, check_only=False):
                 if signal in ['Buy', 'Sell']:
                     contract_type = "CALL" if signal == 'Buy' else "PUT"
                     # Ensure current_amount is valid for order placement
-                    amount_to_bet = max(0.35, round(float(current_amount), 2)) 
+                    amount_to_bet = get_stake_amount(current_amount)
 
                     # Get proposal for the trade
                     proposal_req = {
@@ -479,6 +263,7 @@ def run_trading_job_for_user(session_data, check_only=False):
                         if 'buy' in order_response and 'contract_id' in order_response['buy']:
                             new_contract_id = order_response['buy']['contract_id']
                             trade_start_time = time.time()
+                            stats_cache.record_trade(email, "placed", new_contract_id, amount=amount_to_bet)
                             print(f"User {email}: Placed trade {new_contract_id} with stake {amount_to_bet}. Starting at {datetime.fromtimestamp(trade_start_time)}")
                             # Update DB with new trade info
                             update_stats_and_trade_info_in_db(email, total_wins, total_losses, current_amount, consecutive_losses, initial_balance=initial_balance, contract_id=new_contract_id, trade_start_time=trade_start_time)
@@ -505,51 +290,70 @@ def run_trading_job_for_user(session_data, check_only=False):
 def bot_loop():
     """Main loop that orchestrates trading jobs for all active sessions."""
     print("Bot process started. PID:", os.getpid())
+    storage.dispose() # Pooled connections were inherited from the Streamlit process; open fresh ones
+    worker_id = bot_worker_id() # Owner ID for the sessions this process claims
     update_bot_running_status(1, os.getpid()) # Mark as running with current PID
+    start_stats_api() # Serve the cached stats over HTTP from this process
+    start_profiler() # No-op unless BOT_PROFILE=1
     
     while True:
         try:
-            now = datetime.now()
+            with profile_iteration(): # Logs a breakdown when the iteration runs over budget
+                now = datetime.now()
             
-            # Update heartbeat to show this process is alive and well
-            update_bot_running_status(1, os.getpid())
+                # Update heartbeat to show this process is alive and well
+                update_bot_running_status(1, os.getpid())
             
-            active_sessions = get_all_active_sessions() # Fetch sessions marked as running (is_running = 1)
+                active_sessions = claim_active_sessions(worker_id) # Fetch sessions marked as running that no other bot owns
+                stats_cache.replace_sessions(active_sessions)
+                stats_cache.set_bot_status(1, os.getpid(), len(active_sessions))
             
-            if active_sessions:
-                for session in active_sessions:
-                    email = session['email']
+                if active_sessions:
+                    for session in active_sessions:
+                        email = session['email']
                     
-                    # Get the most up-to-date session data from DB
-                    latest_session_data = get_session_status_from_db(email)
-                    if not latest_session_data or latest_session_data.get('is_running') == 0:
-                        # Session was stopped by UI or timed out, skip
-                        continue
+                        # Stop sessions of users that were removed from user_ids.txt, once no trade is open
+                        if not is_user_active(email) and not session.get('contract_id'):
+                            print(f"User {email} is no longer in the allowlist. Stopping session.")
+                            update_is_running_status(email, 0)
+                            continue
+                    
+                        # Get the most up-to-date session data from DB
+                        latest_session_data = get_session_status_from_db(email)
+                        if not latest_session_data or latest_session_data.get('is_running') == 0:
+                            # Session was stopped by UI or timed out, skip
+                            continue
+                        
+                        # The claim was taken at the start of the iteration; make sure the lease has not
+                        # expired (and been taken over by another bot) while earlier sessions were traded
+                        if not renew_session_claim(email, worker_id):
+                            print(f"User {email}: Session is no longer claimed by this bot. Skipping.")
+                            continue
                         
-                    contract_id = latest_session_data.get('contract_id')
-                    trade_start_time = latest_session_data.get('trade_start_time')
+                        contract_id = latest_session_data.get('contract_id')
+                        trade_start_time = latest_session_data.get('trade_start_time')
                     
-                    # --- Logic to check and close active trades ---
-                    # If a contract is active, we need to check its status.
-                    # The run_trading_job_for_user function handles this internally.
-                    # We only call it if a contract_id exists.
-                    if contract_id:
-                        # Check if trade duration exceeds a reasonable limit (e.g., 20 seconds for 5-tick trades)
-                        # This ensures we don't miss closing an open trade if something goes wrong
-                        if (time.time() - trade_start_time) >= 5: 
-                            print(f"User {email}: Trade {contract_id} might be stuck, checking status...")
-                            run_trading_job_for_user(latest_session_data, check_only=True) # check_only=True to only process completed trades and stop criteria
+                        # --- Logic to check and close active trades ---
+                        # If a contract is active, we need to check its status.
+                        # The run_trading_job_for_user function handles this internally.
+                        # We only call it if a contract_id exists.
+                        if contract_id:
+                            # Check if trade duration exceeds a reasonable limit (e.g., 20 seconds for 5-tick trades)
+                            # This ensures we don't miss closing an open trade if something goes wrong
+                            if (time.time() - trade_start_time) >= 5: 
+                                print(f"User {email}: Trade {contract_id} might be stuck, checking status...")
+                                run_trading_job_for_user(latest_session_data, check_only=True) # check_only=True to only process completed trades and stop criteria
                     
-                    # --- Logic to place new trades ---
-                    # Only attempt to place a new trade if:
-                    # 1. No contract is currently active (contract_id is None)
-                    # 2. It's a suitable time to place a trade (e.g., second is 55, for end of minute cycle)
-                    # 3. The session is still marked as running
-                    elif now.second == 0: # Trigger trade placement logic at the end of a minute cycle
-                        re_checked_session_data = get_session_status_from_db(email) # Re-fetch data just in case
-                        if re_checked_session_data and re_checked_session_data.get('is_running') == 1 and not re_checked_session_data.get('contract_id'):
-                             # The check_only=False ensures it will attempt to place a new trade
-                            run_trading_job_for_user(re_checked_session_data, check_only=False) 
+                        # --- Logic to place new trades ---
+                        # Only attempt to place a new trade if:
+                        # 1. No contract is currently active (contract_id is None)
+                        # 2. It's a suitable time to place a trade (e.g., second is 55, for end of minute cycle)
+                        # 3. The session is still marked as running
+                        elif now.second == 0: # Trigger trade placement logic at the end of a minute cycle
+                            re_checked_session_data = get_session_status_from_db(email) # Re-fetch data just in case
+                            if re_checked_session_data and re_checked_session_data.get('is_running') == 1 and not re_checked_session_data.get('contract_id'):
+                                 # The check_only=False ensures it will attempt to place a new trade
+                                run_trading_job_for_user(re_checked_session_data, check_only=False) 
             
             time.sleep(1) # Wait for 1 second before the next iteration of the loop
         except Exception as e:
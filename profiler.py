@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import atexit
+import signal
+import functools
+import multiprocessing.util
+import threading
+import tracemalloc
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+
+# --- Profiling Configuration ---
+# Opt-in: set BOT_PROFILE=1 to sample the bot loop's stack, trace allocations and log slow iterations.
+PROFILE_ENABLED = os.environ.get("BOT_PROFILE", "0") == "1"
+PROFILE_TRACEMALLOC = os.environ.get("BOT_PROFILE_TRACEMALLOC", "1") == "1"
+PROFILE_DIR = os.environ.get("BOT_PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("BOT_PROFILE_INTERVAL", "0.01"))      # Seconds between stack samples
+PROFILE_FLUSH_SECONDS = float(os.environ.get("BOT_PROFILE_FLUSH_SECONDS", "60"))     # How often profiles are written to disk
+PROFILE_KEEP_SNAPSHOTS = int(os.environ.get("BOT_PROFILE_KEEP_SNAPSHOTS", "24"))      # Timestamped tracemalloc snapshots kept on disk
+ITERATION_BUDGET_SECONDS = float(os.environ.get("BOT_ITERATION_BUDGET", "0.8"))      # Iterations slower than this are logged
+SLOW_ITERATION_TOP_STACKS = 5
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval from a daemon thread.
+    Stacks are aggregated in the folded format ("outer;inner;leaf count") read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL, out_dir=PROFILE_DIR, flush_seconds=PROFILE_FLUSH_SECONDS):
+        self.interval = interval
+        self.out_dir = out_dir
+        self.flush_seconds = flush_seconds
+        self.target_thread_id = None
+        self._lock = threading.RLock() # Reentrant: the SIGTERM handler flushes on the thread that may hold it
+        self._stacks = Counter()           # Since process start, written to disk
+        self._iteration_stacks = Counter() # Since the current bot loop iteration started
+        self._sections = defaultdict(lambda: [0, 0.0, 0]) # name -> [calls, seconds, allocated bytes]
+        self._thread = None
+        self._snapshots = deque() # Paths of timestamped snapshots still on disk, oldest first
+        self._snapshot_count = 0
+        self._final_flush_done = False
+
+    def start(self, target_thread_id=None):
+        self.target_thread_id = target_thread_id or threading.get_ident()
+        os.makedirs(self.out_dir, exist_ok=True)
+        if PROFILE_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            # Every later snapshot can be diffed against this one to see what grew
+            self._dump_snapshot(f"tracemalloc-{os.getpid()}-baseline.snapshot")
+        # The bot runs in a multiprocessing child, which leaves through os._exit: atexit only covers plain scripts,
+        # multiprocessing's own exit hook covers a child that returns or raises
+        atexit.register(self._final_flush)
+        multiprocessing.util.Finalize(self, self._final_flush, exitpriority=100)
+        if threading.current_thread() is threading.main_thread():
+            # Stopping the bot sends SIGTERM. The handler inherited from the parent (Streamlit's, when forked
+            # from the UI) belongs to that process, so it is replaced rather than chained to
+            signal.signal(signal.SIGTERM, self._flush_on_sigterm)
+        self._thread = threading.Thread(target=self._run, name="bot-profiler", daemon=True)
+        self._thread.start()
+        print(f"Profiling enabled. Writing profiles to {os.path.abspath(self.out_dir)}")
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is not None:
+                stack = _fold_stack(frame)
+                with self._lock:
+                    self._stacks[stack] += 1
+                    self._iteration_stacks[stack] += 1
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_seconds
+
+    def flush(self):
+        """Writes the folded stacks and, if tracing, a timestamped tracemalloc snapshot for this process."""
+        pid = os.getpid()
+        with self._lock: # Also serializes the periodic flush with the one at exit
+            try:
+                path = os.path.join(self.out_dir, f"stacks-{pid}.folded")
+                with open(path + ".tmp", "w") as file:
+                    file.writelines(f"{stack} {count}\n" for stack, count in self._stacks.items())
+                os.replace(path + ".tmp", path)
+                if tracemalloc.is_tracing():
+                    self._snapshot_count += 1 # Keeps names unique and sortable even for flushes within one clock tick
+                    name = f"tracemalloc-{pid}-{self._snapshot_count:05d}-{time.strftime('%Y%m%d-%H%M%S')}.snapshot"
+                    self._snapshots.append(self._dump_snapshot(name))
+                    while len(self._snapshots) > PROFILE_KEEP_SNAPSHOTS:
+                        os.remove(self._snapshots.popleft())
+            except OSError as e:
+                print(f"Error writing profile: {e}")
+
+    def _dump_snapshot(self, name):
+        # Load with tracemalloc.Snapshot.load() and diff two of them with Snapshot.compare_to()
+        path = os.path.join(self.out_dir, name)
+        tracemalloc.take_snapshot().dump(path)
+        return path
+
+    def _final_flush(self):
+        with self._lock:
+            if self._final_flush_done:
+                return
+            self._final_flush_done = True
+            self.flush()
+
+    def _flush_on_sigterm(self, signum, _frame):
+        self._final_flush()
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum) # Die from the signal as if no handler had been installed
+
+    def begin_iteration(self):
+        with self._lock:
+            self._iteration_stacks.clear()
+            self._sections.clear()
+
+    def record_section(self, name, seconds, allocated):
+        with self._lock:
+            totals = self._sections[name]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += allocated
+
+    def iteration_breakdown(self):
+        with self._lock:
+            sections = {name: tuple(totals) for name, totals in self._sections.items()}
+            top_stacks = self._iteration_stacks.most_common(SLOW_ITERATION_TOP_STACKS)
+            samples = sum(self._iteration_stacks.values())
+        return sections, top_stacks, samples
+
+
+def _fold_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+profiler = SamplingProfiler() if PROFILE_ENABLED else None
+
+
+def start_profiler():
+    """Starts sampling the calling thread (the bot loop) when profiling is enabled."""
+    if profiler:
+        profiler.start()
+
+
+def profiled(name):
+    """Decorator recording the wall time and allocations of each call under name; a no-op unless profiling."""
+    def decorator(func):
+        if not PROFILE_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracing = tracemalloc.is_tracing()
+            mem_before = tracemalloc.get_traced_memory()[0] if tracing else 0
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                allocated = tracemalloc.get_traced_memory()[0] - mem_before if tracing else 0
+                profiler.record_section(name, time.perf_counter() - start, allocated)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile_iteration(budget=ITERATION_BUDGET_SECONDS):
+    """Wraps one bot loop iteration and logs its breakdown if it exceeds the budget."""
+    if not profiler:
+        yield
+        return
+    profiler.begin_iteration()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if elapsed > budget:
+            _log_slow_iteration(elapsed, budget)
+
+
+def _log_slow_iteration(elapsed, budget):
+    sections, top_stacks, samples = profiler.iteration_breakdown()
+    print(f"Slow bot loop iteration: {elapsed:.3f}s (budget {budget:.3f}s). Section times are inclusive of nested sections:")
+    for name, (calls, seconds, allocated) in sorted(sections.items(), key=lambda item: -item[1][1]):
+        print(f"  {name}: {calls} call(s), {seconds:.3f}s, {allocated / 1024:+.1f} KiB")
+    for stack, count in top_stacks:
+        innermost = " <- ".join(reversed(stack.split(";")[-3:]))
+        print(f"  {count}/{samples} samples in {innermost}")
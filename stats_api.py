@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+# --- Stats API Configuration ---
+# Read-only HTTP service that runs inside the bot process and serves the in-memory cache below,
+# so dashboards and monitoring never touch the database or the broker.
+STATS_API_ENABLED = os.environ.get("STATS_API_ENABLED", "1") == "1"
+STATS_API_HOST = os.environ.get("STATS_API_HOST", "127.0.0.1")
+STATS_API_PORT = int(os.environ.get("STATS_API_PORT", "8765"))
+SSE_KEEPALIVE_SECONDS = 15
+MAX_RECENT_TRADES = 200
+MAX_BUFFERED_EVENTS = 500
+
+# Session columns that are never exposed over HTTP
+_PRIVATE_SESSION_FIELDS = ("user_token", "claimed_by", "claimed_until")
+
+
+# --- In-Memory Stats Cache ---
+class StatsCache:
+    """
+    Latest per-user stats, global bot status and recent trades, updated by the bot loop.
+    Every change is also appended to a numbered event buffer that feeds the SSE stream.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._sessions = {}
+        self._status = {"is_running": 0, "last_heartbeat": 0.0, "process_pid": 0, "active_sessions": 0}
+        self._trades = deque(maxlen=MAX_RECENT_TRADES)
+        self._events = deque(maxlen=MAX_BUFFERED_EVENTS)
+        self._seq = 0
+        # Prefixed to SSE event IDs so a client resuming against a restarted bot gets a fresh snapshot
+        self.epoch = f"{os.getpid()}.{int(time.time() * 1000)}"
+
+    def _publish(self, event, data, email=None):
+        # Caller must hold self._cond
+        self._seq += 1
+        self._events.append((self._seq, event, email, data))
+        self._cond.notify_all()
+
+    def set_bot_status(self, is_running, pid, active_sessions):
+        with self._cond:
+            changed = (self._status["is_running"], self._status["process_pid"], self._status["active_sessions"]) != (is_running, pid, active_sessions)
+            self._status = {"is_running": is_running, "last_heartbeat": time.time(), "process_pid": pid, "active_sessions": active_sessions}
+            if changed: # Heartbeat-only changes are not pushed
+                self._publish("status", dict(self._status))
+
+    def replace_sessions(self, sessions):
+        """Stores the current rows for all active sessions; users missing from the list are dropped."""
+        public = {}
+        for session in sessions:
+            public[session["email"]] = {k: v for k, v in session.items() if k not in _PRIVATE_SESSION_FIELDS}
+        with self._cond:
+            for email, stats in public.items():
+                if self._sessions.get(email) != stats:
+                    self._publish("stats", stats, email=email)
+            for email in self._sessions.keys() - public.keys():
+                self._publish("stats", {"email": email, "is_running": 0}, email=email)
+            self._sessions = public
+
+    def record_trade(self, email, event, contract_id, amount=None, profit=None):
+        trade = {"email": email, "event": event, "contract_id": contract_id, "amount": amount, "profit": profit, "time": time.time()}
+        with self._cond:
+            self._trades.append(trade)
+            self._publish("trade", trade, email=email)
+
+    def get_status(self):
+        with self._cond:
+            return dict(self._status)
+
+    def get_session(self, email):
+        with self._cond:
+            stats = self._sessions.get(email)
+            return dict(stats) if stats else None
+
+    def get_trades(self, email=None, limit=50):
+        with self._cond:
+            trades = [t for t in self._trades if email is None or t["email"] == email]
+        return trades[-limit:][::-1] # Newest first
+
+    def snapshot(self, email=None):
+        """Returns the current sequence number with the status and session stats it corresponds to."""
+        with self._cond:
+            sessions = [dict(v) for k, v in self._sessions.items() if email is None or k == email]
+            return self._seq, dict(self._status), sessions
+
+    def can_resume(self, after_seq):
+        """True if every event after after_seq is still buffered in this process's stream."""
+        with self._cond:
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            return oldest - 1 <= after_seq <= self._seq
+
+    def wait_for_events(self, after_seq, timeout):
+        """Blocks until events newer than after_seq exist (or timeout) and returns them."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq, timeout=timeout)
+            return [e for e in self._events if e[0] > after_seq], self._seq
+
+
+stats_cache = StatsCache()
+
+
+# --- Flask App ---
+app = Flask(__name__)
+
+@app.route("/health")
+def health():
+    return jsonify({"ok": True})
+
+@app.route("/status")
+def bot_status():
+    return jsonify(stats_cache.get_status())
+
+@app.route("/stats/<email>")
+def user_stats(email):
+    stats = stats_cache.get_session(email)
+    if stats is None:
+        return jsonify({"error": "No active session for this user."}), 404
+    return jsonify(stats)
+
+@app.route("/trades")
+def recent_trades():
+    limit = max(1, min(request.args.get("limit", 50, type=int), MAX_RECENT_TRADES))
+    return jsonify(stats_cache.get_trades(email=request.args.get("email"), limit=limit))
+
+@app.route("/events")
+def events():
+    """Server-sent events stream of status, stats and trade updates, optionally filtered with ?email=."""
+    email = request.args.get("email")
+    last_seq = _parse_event_id(request.headers.get("Last-Event-ID"))
+
+    def stream():
+        if last_seq is not None and stats_cache.can_resume(last_seq):
+            seq = last_seq
+        else:
+            # New client, or an ID from another bot process or older than the buffer: start from a snapshot
+            seq, status, sessions = stats_cache.snapshot(email)
+            yield f"id: {stats_cache.epoch}-{seq}\nevent: status\ndata: {json.dumps(status)}\n\n"
+            for stats in sessions:
+                yield f"event: stats\ndata: {json.dumps(stats)}\n\n"
+        while True:
+            pending, seq_now = stats_cache.wait_for_events(seq, SSE_KEEPALIVE_SECONDS)
+            if not pending:
+                yield ": keepalive\n\n"
+            for event_seq, event, event_email, data in pending:
+                if email is None or event_email in (None, email):
+                    yield f"id: {stats_cache.epoch}-{event_seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+            seq = seq_now
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream(), mimetype="text/event-stream", headers=headers)
+
+
+def _parse_event_id(event_id):
+    """Returns the sequence number of an ID issued by this process's stream, otherwise None."""
+    epoch, _, seq = (event_id or "").rpartition("-")
+    if epoch != stats_cache.epoch or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+def start_stats_api():
+    """
+    Binds the stats API in the calling (bot) process and serves it from a daemon thread.
+    Returns None, after logging why, if it is disabled or the port cannot be bound.
+    """
+    if not STATS_API_ENABLED:
+        return None
+    try:
+        server = make_server(STATS_API_HOST, STATS_API_PORT, app, threaded=True)
+    except OSError as e:
+        print(f"Stats API could not listen on {STATS_API_HOST}:{STATS_API_PORT}: {e}. Continuing without it.")
+        return None
+    except SystemExit: # werkzeug prints the reason and exits instead of raising when the port is taken
+        print(f"Stats API could not listen on {STATS_API_HOST}:{STATS_API_PORT}. Continuing without it.")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name="stats-api", daemon=True)
+    thread.start()
+    print(f"Stats API listening on http://{STATS_API_HOST}:{STATS_API_PORT}")
+    return server
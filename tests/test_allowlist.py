@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+import allowlist
+from allowlist import UserAllowlist
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls allowlist's time.monotonic() so the check throttle and grace period run without sleeping."""
+    now = [1000.0]
+    monkeypatch.setattr(allowlist.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Counts how often the allowlist file is opened."""
+    opened = []
+
+    def counting_open(*args, **kwargs):
+        opened.append(args[0])
+        return open(*args, **kwargs)
+
+    monkeypatch.setattr(allowlist, "open", counting_open, raising=False)
+    return opened
+
+
+def write(path, text, mtime):
+    path.write_text(text)
+    os.utime(path, ns=(mtime * 10**9, mtime * 10**9)) # Distinct mtimes even within one filesystem tick
+
+
+@pytest.fixture
+def users_file(tmp_path):
+    path = tmp_path / "user_ids.txt"
+    write(path, "a@x\n\n b@x \n", mtime=1)
+    return path
+
+
+def test_lookup_after_load(users_file, clock):
+    al = UserAllowlist(str(users_file))
+    assert "a@x" in al
+    assert "b@x" in al
+    assert "c@x" not in al
+    assert len(al) == 2
+
+
+def test_reload_after_rewrite(users_file, clock):
+    al = UserAllowlist(str(users_file))
+    assert "a@x" in al
+
+    write(users_file, "c@x\n", mtime=2)
+    assert "a@x" in al # Still within the check interval
+    clock[0] += 1.0
+    assert "a@x" not in al
+    assert "c@x" in al
+
+
+def test_unchanged_file_is_not_reread(users_file, clock, reads):
+    al = UserAllowlist(str(users_file))
+    for _ in range(5):
+        assert "a@x" in al
+        clock[0] += 1.0
+    assert len(reads) == 1
+
+
+@pytest.mark.parametrize("make_unavailable", [
+    lambda path: write(path, "", mtime=2),
+    lambda path: path.unlink(),
+], ids=["emptied", "deleted"])
+def test_brief_missing_or_empty_file_keeps_users(users_file, clock, reads, capsys, make_unavailable):
+    al = UserAllowlist(str(users_file), empty_grace=5.0)
+    assert "a@x" in al
+
+    make_unavailable(users_file)
+    for _ in range(3):
+        clock[0] += 1.0
+        assert "a@x" in al
+    write(users_file, "a@x\nc@x\n", mtime=3)
+    clock[0] += 1.0
+
+    assert "c@x" in al
+    assert "a@x" in al
+    assert capsys.readouterr().out.count("Warning") == 1
+    assert len(reads) <= 3 # Initial load, the empty file (if it exists) and the rewrite
+
+
+@pytest.mark.parametrize("make_unavailable", [
+    lambda path: write(path, "", mtime=2),
+    lambda path: path.unlink(),
+], ids=["emptied", "deleted"])
+def test_lasting_missing_or_empty_file_revokes_everyone(users_file, clock, capsys, make_unavailable):
+    al = UserAllowlist(str(users_file), empty_grace=5.0)
+    assert "a@x" in al
+
+    make_unavailable(users_file)
+    clock[0] += 1.0
+    assert "a@x" in al
+    clock[0] += 5.0
+    assert "a@x" not in al
+    clock[0] += 1.0
+    assert "a@x" not in al
+
+    out = capsys.readouterr().out
+    assert out.count("Warning") == 1
+    assert out.count("Revoking") == 1
+
+
+def test_missing_file_at_start_allows_nobody(tmp_path, clock):
+    al = UserAllowlist(str(tmp_path / "absent.txt"))
+    assert "a@x" not in al
+    assert len(al) == 0
@@ -0,0 +1,101 @@
+import glob
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+import profiler
+from profiler import SamplingProfiler, profile_iteration, profiled
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    """Turns profiling on with a profiler whose sampling thread is not started, so tests control its samples."""
+    instance = SamplingProfiler(out_dir=str(tmp_path), flush_seconds=60)
+    monkeypatch.setattr(profiler, "PROFILE_ENABLED", True)
+    monkeypatch.setattr(profiler, "profiler", instance)
+    return instance
+
+
+@pytest.fixture
+def tracing():
+    tracemalloc.start()
+    yield
+    tracemalloc.stop()
+
+
+def test_profiled_returns_original_function_when_disabled(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_ENABLED", False)
+
+    def job():
+        return 42
+
+    assert profiled("job")(job) is job
+
+
+def test_profile_iteration_is_silent_within_budget(enabled, capsys):
+    job = profiled("job")(lambda: None)
+
+    with profile_iteration(budget=10.0):
+        job()
+
+    assert capsys.readouterr().out == ""
+
+
+def test_profile_iteration_logs_breakdown_over_budget(enabled, capsys):
+    job = profiled("run_trading_job_for_user")(lambda: time.sleep(0.02))
+
+    with profile_iteration(budget=0.01):
+        job()
+        job()
+        enabled._iteration_stacks["bot_loop (app.py:1);run_trading_job_for_user (app.py:2);recv (socket.py:3)"] += 3
+
+    out = capsys.readouterr().out
+    assert "Slow bot loop iteration" in out
+    assert "run_trading_job_for_user: 2 call(s)" in out
+    assert "3/3 samples in recv (socket.py:3) <- run_trading_job_for_user (app.py:2) <- bot_loop (app.py:1)" in out
+
+
+def test_flush_writes_folded_stacks_and_prunes_snapshots(enabled, tracing, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiler, "PROFILE_KEEP_SNAPSHOTS", 2)
+    enabled._stacks["bot_loop (app.py:1);analyse_data (app.py:2)"] = 7
+
+    for _ in range(4):
+        enabled.flush()
+
+    with open(tmp_path / f"stacks-{os.getpid()}.folded") as file:
+        assert file.read() == "bot_loop (app.py:1);analyse_data (app.py:2) 7\n"
+    snapshots = sorted(glob.glob(str(tmp_path / "tracemalloc-*.snapshot")))
+    assert len(snapshots) == 2
+    assert snapshots[-1].split("-")[-3] == "00004" # The newest ones are kept
+    tracemalloc.Snapshot.load(snapshots[-1])
+
+
+def _profiled_bot(out_dir, mode):
+    SamplingProfiler(out_dir=out_dir, flush_seconds=60).start()
+    time.sleep(0.2)
+    if mode == "terminate":
+        time.sleep(30)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the bot process is forked")
+@pytest.mark.parametrize("mode", ["terminate", "return"])
+def test_forked_bot_writes_profile_on_exit(tmp_path, mode):
+    previous = signal.signal(signal.SIGTERM, lambda *_: None) # Like Streamlit, the parent has its own handler
+    try:
+        process = multiprocessing.get_context("fork").Process(target=_profiled_bot, args=(str(tmp_path), mode), daemon=True)
+        process.start()
+        if mode == "terminate":
+            time.sleep(1)
+            process.terminate()
+        process.join(10)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+
+    assert process.exitcode == (-signal.SIGTERM if mode == "terminate" else 0)
+    assert os.path.exists(tmp_path / f"stacks-{process.pid}.folded")
+    assert glob.glob(str(tmp_path / f"tracemalloc-{process.pid}-0*.snapshot"))
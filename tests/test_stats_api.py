@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+import stats_api
+from stats_api import StatsCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fresh = StatsCache()
+    monkeypatch.setattr(stats_api, "stats_cache", fresh)
+    return fresh
+
+
+@pytest.fixture
+def client():
+    return stats_api.app.test_client()
+
+
+def read_events(client, cache, count, last_event_id=None):
+    """Opens /events, publishes one trade shortly after and returns the first count messages."""
+    headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+    response = client.get("/events", headers=headers, buffered=False)
+    threading.Timer(0.1, cache.record_trade, args=("a@x", "placed", "c-new")).start()
+    stream = iter(response.response)
+    try:
+        return [next(stream).decode() for _ in range(count)]
+    finally:
+        response.close()
+
+
+@pytest.mark.parametrize("last_event_id", ["1000", "other.epoch-1"])
+def test_foreign_last_event_id_gets_snapshot_and_new_events(client, cache, last_event_id):
+    cache.replace_sessions([{"email": "a@x", "user_token": "secret", "total_wins": 1}])
+
+    status, stats, trade = read_events(client, cache, 3, last_event_id)
+
+    assert "event: status" in status
+    assert "event: stats" in stats and "secret" not in stats
+    assert "event: trade" in trade and "c-new" in trade
+
+
+def test_resume_replays_buffered_events(client, cache):
+    cache.record_trade("a@x", "placed", "c-missed")
+
+    missed, new = read_events(client, cache, 2, f"{cache.epoch}-0")
+
+    assert "c-missed" in missed
+    assert "c-new" in new
+
+
+@pytest.mark.parametrize("limit, expected", [("0", ["c3"]), ("-1", ["c3"]), ("2", ["c3", "c2"]), ("999", ["c3", "c2", "c1"])])
+def test_trades_limit_is_clamped(client, cache, limit, expected):
+    for contract_id in ("c1", "c2", "c3"):
+        cache.record_trade("a@x", "placed", contract_id)
+
+    trades = client.get(f"/trades?limit={limit}").json
+
+    assert [t["contract_id"] for t in trades] == expected
@@ -0,0 +1,170 @@
+import os
+import threading
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+import storage
+from storage import PostgresStorage, SQLiteStorage, create_storage, metadata, sessions_table
+
+SETTINGS = {"user_token": "token", "base_amount": 0.35, "tp_target": 10.0, "max_consecutive_losses": 3}
+
+# Point at a disposable database (e.g. postgresql+psycopg2://localhost/khoury_test) to run the suite
+# against it; its sessions and bot_nodes tables are dropped around every test. Defaults to a temp SQLite file.
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+postgres_only = pytest.mark.skipif(
+    not (TEST_DATABASE_URL or "").startswith("postgres"), reason="needs TEST_DATABASE_URL pointing at PostgreSQL"
+)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """A storage backend on an empty database (no tables yet)."""
+    backend = create_storage(TEST_DATABASE_URL or f"sqlite:///{tmp_path / 'trading.db'}")
+    metadata.drop_all(backend.engine)
+    yield backend
+    metadata.drop_all(backend.engine)
+    backend.engine.dispose()
+
+
+@pytest.fixture
+def db(backend):
+    backend.create_tables()
+    return backend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls storage's time.time() so lease expiry can be tested without sleeping."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(storage.time, "time", lambda: now[0])
+    return now
+
+
+def test_claim_is_exclusive_until_lease_expires(db, clock):
+    db.start_session("a@x", SETTINGS)
+
+    assert [s["email"] for s in db.claim_active_sessions("node-1", lease_seconds=30)] == ["a@x"]
+    assert db.claim_active_sessions("node-2", lease_seconds=30) == []
+
+    clock[0] += 10
+    assert [s["email"] for s in db.claim_active_sessions("node-1", lease_seconds=30)] == ["a@x"] # Owner renews
+    clock[0] += 35
+    assert [s["email"] for s in db.claim_active_sessions("node-2", lease_seconds=30)] == ["a@x"]
+    assert db.claim_active_sessions("node-1", lease_seconds=30) == []
+
+
+def test_renew_claim_fails_after_takeover(db, clock):
+    db.start_session("a@x", SETTINGS)
+    db.claim_active_sessions("node-1", lease_seconds=30)
+    assert db.renew_claim("a@x", "node-1")
+    assert not db.renew_claim("a@x", "node-2")
+
+    clock[0] += 60
+    assert not db.renew_claim("a@x", "node-1") # Expired leases are not revived
+    db.claim_active_sessions("node-2", lease_seconds=30)
+    assert not db.renew_claim("a@x", "node-1")
+    assert db.renew_claim("a@x", "node-2")
+
+
+def test_stopping_a_session_releases_its_claim(db):
+    db.start_session("a@x", SETTINGS)
+    db.claim_active_sessions("node-1")
+    db.set_session_running("a@x", 0)
+    db.set_session_running("a@x", 1)
+    assert [s["email"] for s in db.claim_active_sessions("node-2")] == ["a@x"]
+
+
+def test_start_session_resets_existing_stats(db):
+    db.start_session("a@x", SETTINGS)
+    db.update_stats("a@x", 4, 2, 1.5, 2, initial_balance=100.0, contract_id="c1", trade_start_time=5.0)
+
+    db.start_session("a@x", dict(SETTINGS, base_amount=0.5))
+
+    session = db.get_session("a@x")
+    assert session["base_amount"] == 0.5
+    assert session["current_amount"] == 0.5
+    assert (session["total_wins"], session["total_losses"], session["consecutive_losses"]) == (0, 0, 0)
+    assert session["initial_balance"] == 0.0
+    assert session["contract_id"] is None
+    assert session["is_running"] == 1
+
+
+def test_update_stats_keeps_balance_and_start_time_when_not_given(db):
+    db.start_session("a@x", SETTINGS)
+    db.update_stats("a@x", 1, 0, 0.35, 0, initial_balance=100.0, contract_id="c1", trade_start_time=5.0)
+    db.update_stats("a@x", 1, 1, 0.74, 1, contract_id=None)
+
+    session = db.get_session("a@x")
+    assert (session["initial_balance"], session["trade_start_time"], session["contract_id"]) == (100.0, 5.0, None)
+
+
+def test_create_tables_migrates_legacy_sessions_table(backend):
+    with backend.engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE sessions (
+                email TEXT PRIMARY KEY, user_token TEXT NOT NULL, base_amount REAL NOT NULL, tp_target REAL NOT NULL,
+                max_consecutive_losses INTEGER NOT NULL, total_wins INTEGER DEFAULT 0, total_losses INTEGER DEFAULT 0,
+                current_amount REAL NOT NULL, consecutive_losses INTEGER DEFAULT 0, initial_balance REAL DEFAULT 0.0,
+                contract_id TEXT, trade_start_time REAL DEFAULT 0.0, is_running INTEGER DEFAULT 0
+            )
+        """))
+        conn.execute(text("INSERT INTO sessions (email, user_token, base_amount, tp_target, max_consecutive_losses, current_amount, is_running) VALUES ('a@x', 't', 0.35, 10, 3, 0.35, 1)"))
+
+    backend.create_tables()
+    backend.create_tables() # Idempotent on an already migrated database
+
+    session = backend.get_session("a@x")
+    assert session["claimed_by"] is None
+    assert [s["email"] for s in backend.claim_active_sessions("node-1")] == ["a@x"]
+
+
+def test_bot_status_is_kept_per_node(db):
+    db.set_bot_status("node-1", "host-1", 1, 111)
+    db.set_bot_status("node-2", "host-2", 1, 222)
+    db.set_bot_status("node-1", "host-1", 0, 0)
+
+    status, _heartbeat, pid, hostname = db.get_bot_status("node-1")
+    assert (status, pid, hostname) == (0, 0, "host-1")
+    status, _heartbeat, pid, hostname = db.get_bot_status("node-2")
+    assert (status, pid, hostname) == (1, 222, "host-2")
+    assert db.get_bot_status("node-3") is None
+
+
+def test_create_storage_picks_backend_by_url(tmp_path):
+    assert isinstance(create_storage(f"sqlite:///{tmp_path / 'x.db'}"), SQLiteStorage)
+    with pytest.raises(ValueError):
+        create_storage("mysql://localhost/x")
+
+
+def test_postgres_claim_query_skips_locked_rows(db):
+    query = db.claimable_sessions_query("node-1", 0.0)
+    assert str(query.compile(dialect=postgresql.dialect())).endswith("FOR UPDATE SKIP LOCKED")
+
+
+@postgres_only
+def test_postgres_backend_is_selected(db):
+    assert isinstance(db, PostgresStorage)
+
+
+@postgres_only
+def test_claim_skips_rows_locked_by_another_claim(db):
+    db.start_session("a@x", SETTINGS)
+    db.start_session("b@x", SETTINGS)
+
+    # Another node is in the middle of claiming a@x: its transaction holds the row lock
+    with db.engine.connect() as other:
+        other_claim = other.begin()
+        other.execute(select(sessions_table).where(sessions_table.c.email == "a@x").with_for_update()).all()
+
+        claimed = []
+        worker = threading.Thread(target=lambda: claimed.extend(db.claim_active_sessions("node-2")), daemon=True)
+        worker.start()
+        worker.join(timeout=5)
+        assert not worker.is_alive(), "claim waited on the locked row instead of skipping it"
+        other_claim.rollback()
+
+    assert [s["email"] for s in claimed] == ["b@x"]
+    assert [s["email"] for s in db.claim_active_sessions("node-3")] == ["a@x"] # Free again once the lock is gone